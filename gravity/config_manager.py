@@ -1,30 +1,32 @@
 """ Galaxy Process Management superclass and utilities
 """
 import contextlib
-import glob
 import logging
 import os
-import xml.etree.ElementTree as elementtree
 from typing import Union
 
 try:
     from pydantic.v1 import ValidationError
 except ImportError:
     from pydantic import ValidationError
-from yaml import safe_load
+from yaml import load
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
 
 import gravity.io
 from gravity.settings import Settings
 from gravity.state import ConfigFile, service_for_service_type
-from gravity.util import recursive_update
+from gravity.util import cached_by_stat, recursive_update
 
 log = logging.getLogger(__name__)
 
 # Falling back to job_conf.xml when job_config_file is unset and job_conf.yml doesn't exist is deprecated in Galaxy, and
 # support for it can be removed from Gravity when it is removed from Galaxy
 DEFAULT_JOB_CONFIG_FILES = ("job_conf.yml", "job_conf.xml")
-if "XDG_CONFIG_HOME" in os.environ:
-    DEFAULT_STATE_DIR = os.path.join(os.environ["XDG_CONFIG_HOME"], "galaxy-gravity")
+# Galaxy job handler assignment methods that allow handlers to be defined outside of the job config
+DYNAMIC_HANDLER_ASSIGNMENT_METHODS = frozenset(("db-skip-locked", "db-transaction-isolation"))
 
 OPTIONAL_APP_KEYS = (
     "interactivetools_map",
@@ -34,6 +36,24 @@ OPTIONAL_APP_KEYS = (
 )
 
 
+def load_config_yaml(stream):
+    """Equivalent to ``yaml.safe_load()``, but uses the libyaml-based loader if PyYAML was built with it."""
+    return load(stream, Loader=SafeLoader)
+
+
+def config_files_in_dir(path, extensions=(".yml", ".yaml")):
+    """Return the YAML files in ``path``, grouped by extension in the order of ``extensions``.
+
+    Uses a single ``os.scandir()`` pass rather than globbing once per extension.
+    """
+    try:
+        with os.scandir(path) as it:
+            entries = [e for e in it if e.name.endswith(extensions) and not e.name.startswith(".") and e.is_file()]
+    except OSError:
+        return []
+    return [e.path for extension in extensions for e in entries if e.name.endswith(extension)]
+
+
 @contextlib.contextmanager
 def config_manager(config_file=None, state_dir=None, user_mode=None):
     yield ConfigManager(config_file=config_file, state_dir=state_dir, user_mode=user_mode)
@@ -46,6 +66,7 @@ class ConfigManager(object):
 
     def __init__(self, config_file=None, state_dir=None, user_mode=None):
         self.__configs = {}
+        self.__app_configs = {}
         self.state_dir = None
         if state_dir is not None:
             # convert from pathlib.Path
@@ -65,9 +86,11 @@ class ConfigManager(object):
         return os.geteuid() == 0
 
     def load_config_file(self, config_file):
+        # normalize once so that paths derived from it can be joined without further abspath() calls
+        config_file = os.path.abspath(config_file)
         with open(config_file) as config_fh:
             try:
-                config_dict = safe_load(config_fh)
+                config_dict = load_config_yaml(config_fh)
             except Exception as exc:
                 # this should always be a parse error, access errors will be caught by click
                 gravity.io.error(f"Failed to parse config: {config_file}")
@@ -107,16 +130,20 @@ class ConfigManager(object):
         server_section = self.galaxy_server_config_section
         if not os.path.isabs(app_config_file):
             app_config_file = os.path.join(os.path.dirname(gravity_config_file), app_config_file)
+        if app_config_file in self.__app_configs:
+            # multiple Gravity configs can share a Galaxy config, only read and parse it once
+            return self.__app_configs[app_config_file].copy()
         try:
             with open(app_config_file) as config_fh:
-                _app_config_dict = safe_load(config_fh)
+                _app_config_dict = load_config_yaml(config_fh)
                 if server_section not in _app_config_dict:
                     # we let a missing galaxy config slide in other scenarios but if you set the option to something
                     # that doesn't contain a galaxy section that's almost surely a mistake
                     gravity.io.exception(f"Galaxy config file does not contain a {server_section} section: {app_config_file}")
             app_config = _app_config_dict[server_section] or {}
             app_config["__file__"] = app_config_file
-            return app_config
+            self.__app_configs[app_config_file] = app_config
+            return app_config.copy()
         except Exception as exc:
             gravity.io.exception(exc)
 
@@ -211,17 +238,17 @@ class ConfigManager(object):
             # config embedded directly in Galaxy config
             job_config = app_config["job_config"]
         else:
-            # config in an external file
+            # config in an external file, galaxy_config_file is already absolute so normpath() is sufficient here
             config_dir = os.path.dirname(config.galaxy_config_file)
             job_config = app_config.get("job_config_file")
             if not job_config:
-                for job_config in [os.path.abspath(os.path.join(config_dir, c)) for c in DEFAULT_JOB_CONFIG_FILES]:
+                for job_config in (os.path.normpath(os.path.join(config_dir, c)) for c in DEFAULT_JOB_CONFIG_FILES):
                     if os.path.exists(job_config):
                         break
                 else:
                     job_config = None
             elif not os.path.isabs(job_config):
-                job_config = os.path.abspath(os.path.join(config_dir, job_config))
+                job_config = os.path.normpath(os.path.join(config_dir, job_config))
                 if not os.path.exists(job_config):
                     job_config = None
         if job_config:
@@ -241,7 +268,7 @@ class ConfigManager(object):
         # handlers, and gravity is only 1 of them.
         assign_with = assign_with or []
         expanded_handlers = self.expand_handlers(gravity_settings, config)
-        if expanded_handlers and "db-skip-locked" not in assign_with and "db-transaction-isolation" not in assign_with:
+        if expanded_handlers and DYNAMIC_HANDLER_ASSIGNMENT_METHODS.isdisjoint(assign_with):
             gravity.io.warn(
                 "Dynamic handlers are configured in Gravity but Galaxy is not configured to assign jobs to handlers "
                 "dynamically, so these handlers will not handle jobs. Set the job handler assignment method in the "
@@ -262,7 +289,8 @@ class ConfigManager(object):
         expanded_handlers = {}
         default_name_template = "{name}_{process}"
         for service_name, handler_config in handlers.items():
-            handler_config["enable"] = True
+            # build a new dict rather than modifying the settings in place
+            handler_config = {**handler_config, "enable": True}
             count = handler_config.get("processes", 1)
             if "pools" in handler_config:
                 handler_config["server_pools"] = handler_config.pop("pools")
@@ -291,21 +319,47 @@ class ConfigManager(object):
     @staticmethod
     def get_job_config(conf: Union[str, dict]):
         """Extract handler names from job_conf.xml"""
+        if not isinstance(conf, str):
+            return ConfigManager._parse_job_config(conf)
+        # instances commonly share a job config, only reparse it if it has changed on disk
+        try:
+            assign_with, rval = cached_by_stat(conf, ConfigManager._parse_job_config)
+        except FileNotFoundError:
+            # let the parser report the missing (or unknown type of) file the way it always has
+            return ConfigManager._parse_job_config(conf)
+        # callers modify the returned handler settings
+        return (assign_with, [handler_settings.copy() for handler_settings in rval])
+
+    @staticmethod
+    def _parse_job_config(conf: Union[str, dict]):
         # TODO: use galaxy job conf parsing
         assign_with = None
         rval = []
         if isinstance(conf, str):
             if conf.endswith('.xml'):
-                root = elementtree.parse(conf).getroot()
-                handlers = root.find("handlers")
-                assign_with = (handlers or {}).get("assign_with")
+                # only needed for the deprecated XML job config format, so don't pay for the import otherwise
+                import xml.etree.ElementTree as elementtree
+                # stream the document and stop after the top-level <handlers>, the rest of the tree is not needed
+                depth = 0
+                in_handlers = False
+                for event, elem in elementtree.iterparse(conf, events=("start", "end")):
+                    if event == "start":
+                        depth += 1
+                        if depth == 2 and elem.tag == "handlers":
+                            in_handlers = True
+                            assign_with = elem.get("assign_with")
+                        elif depth == 3 and in_handlers:
+                            rval.append({"service_name": elem.attrib["id"]})
+                    else:
+                        depth -= 1
+                        if in_handlers and depth == 1:
+                            break
+                        elem.clear()
                 if assign_with:
                     assign_with = [a.strip() for a in assign_with.split(",")]
-                for handler in (handlers or []):
-                    rval.append({"service_name": handler.attrib["id"]})
             elif conf.endswith(('.yml', '.yaml')):
                 with open(conf) as job_conf_fh:
-                    conf = safe_load(job_conf_fh.read())
+                    conf = load_config_yaml(job_conf_fh)
             else:
                 gravity.io.exception(f"Unknown job config file type: {conf}")
         if isinstance(conf, dict):
@@ -330,17 +384,17 @@ class ConfigManager(object):
         return self.instance_count == 1
 
     def is_loaded(self, config_file):
-        return config_file in self.get_configured_files()
+        return any(config_file == c.gravity_config_file for c in self.__configs.values())
 
     def get_configs(self, instances=None, process_manager=None):
         """Return the persisted values of all config files registered with the config manager."""
-        rval = []
-        for instance_name, config in list(self.__configs.items()):
-            if ((instances is not None and instance_name in instances) or instances is None) and (
-                (process_manager is not None and config.process_manager == process_manager) or process_manager is None
-            ):
-                rval.append(config)
-        return rval
+        if instances is not None:
+            instances = set(instances)
+        return [
+            config for instance_name, config in self.__configs.items()
+            if (instances is None or instance_name in instances)
+            and (process_manager is None or config.process_manager == process_manager)
+        ]
 
     def get_config(self, instance_name=None):
         if instance_name is None:
@@ -348,18 +402,14 @@ class ConfigManager(object):
                 gravity.io.exception("An instance name is required when more than one instance is configured")
             elif self.instance_count == 0:
                 gravity.io.exception("No configured Galaxy instances")
-            instance_name = list(self.__configs.keys())[0]
+            instance_name = next(iter(self.__configs))
         try:
             return self.__configs[instance_name]
         except KeyError:
             gravity.io.exception(f"Unknown instance name: {instance_name}")
 
     def get_configured_service_names(self):
-        rval = set()
-        for config in self.get_configs():
-            for service in config.services:
-                rval.add(service.service_name)
-        return rval
+        return {service.service_name for config in self.__configs.values() for service in config.services}
 
     def get_configured_instance_names(self):
         return list(self.__configs.keys())
@@ -379,13 +429,12 @@ class ConfigManager(object):
             configs = (
                 "/etc/galaxy/gravity.yml",
                 "/etc/galaxy/galaxy.yml",
-                *glob.glob("/etc/galaxy/gravity.d/*.yml"),
-                *glob.glob("/etc/galaxy/gravity.d/*.yaml"),
+                *config_files_in_dir("/etc/galaxy/gravity.d"),
             )
         else:
             configs = (os.path.join("config", "galaxy.yml"), os.path.join("config", "galaxy.yml.sample"))
         for config in configs:
             if os.path.exists(config):
-                self.load_config_file(os.path.abspath(config))
+                self.load_config_file(config)
                 if not load_all:
                     return
@@ -6,6 +6,16 @@ import click
 
 DEBUG = False
 
+# click.echo() strips styles again when not writing to a terminal, so don't bother adding them in that case
+STYLE_STDOUT = sys.stdout is not None and sys.stdout.isatty()
+STYLE_STDERR = sys.stderr is not None and sys.stderr.isatty()
+
+
+def _style(message, err=False, **style_kwargs):
+    if style_kwargs and (STYLE_STDERR if err else STYLE_STDOUT):
+        return click.style(message, **style_kwargs)
+    return message
+
 
 def debug(message, *args):
     if args:
@@ -20,7 +30,7 @@ def info(message, *args, bright=True):
     style_kwargs = {}
     if bright:
         style_kwargs = {"bold": True, "fg": "green"}
-    click.echo(click.style(message, **style_kwargs))
+    click.echo(_style(message, **style_kwargs))
 
 
 def error(message, *args):
@@ -28,13 +38,13 @@ def error(message, *args):
         message = message % args
     if DEBUG and sys.exc_info()[0] is not None:
         click.echo(traceback.format_exc(), nl=False)
-    click.echo(click.style(message, bold=True, fg="red"), err=True)
+    click.echo(_style(message, err=True, bold=True, fg="red"), err=True)
 
 
 def warn(message, *args):
     if args:
         message = message % args
-    click.echo(click.style(message, fg="red"), err=True)
+    click.echo(_style(message, err=True, fg="red"), err=True)
 
 
 def exception(message):
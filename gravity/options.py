@@ -2,6 +2,12 @@
 """
 import click
 
+# click parameter types are stateless, so share them between the commands that use them
+STATE_DIR_PATH = click.Path(file_okay=False, writable=True, resolve_path=True)
+CONFIG_FILE_PATH = click.Path(exists=True, dir_okay=False, resolve_path=True)
+READABLE_FILE_PATH = click.Path(exists=False, file_okay=True, dir_okay=False, readable=True, resolve_path=True)
+EXISTING_READABLE_FILE_PATH = click.Path(exists=True, file_okay=True, dir_okay=False, readable=True, resolve_path=True)
+
 
 def debug_option():
     return click.option("-d", "--debug", is_flag=True, help="Enables debug mode.")
@@ -9,7 +15,7 @@ def debug_option():
 
 def state_dir_option():
     return click.option(
-        "--state-dir", type=click.Path(file_okay=False, writable=True, resolve_path=True), help="Where process management configs and state will be stored."
+        "--state-dir", type=STATE_DIR_PATH, help="Where process management configs and state will be stored."
     )
 
 
@@ -17,7 +23,7 @@ def config_file_option():
     return click.option(
         "-c",
         "--config-file",
-        type=click.Path(exists=True, dir_okay=False, resolve_path=True),
+        type=CONFIG_FILE_PATH,
         multiple=True,
         help="Gravity (or Galaxy) config file to operate on. Can also be set with $GRAVITY_CONFIG_FILE or $GALAXY_CONFIG_FILE",
     )
@@ -38,13 +44,7 @@ def no_log_option():
 
 
 def required_config_arg(name="config", exists=False, nargs=None):
-    arg_type = click.Path(
-        exists=exists,
-        file_okay=True,
-        dir_okay=False,
-        readable=True,
-        resolve_path=True,
-    )
+    arg_type = EXISTING_READABLE_FILE_PATH if exists else READABLE_FILE_PATH
     if nargs is None:
         return click.argument(name, type=arg_type)
     else:
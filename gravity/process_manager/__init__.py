@@ -1,14 +1,14 @@
 """ Galaxy Process Management superclass and utilities
 """
+import collections.abc
 import contextlib
-import errno
-import importlib
 import inspect
 import os
 import shlex
+import shutil
 import sys
 from abc import ABCMeta, abstractmethod
-from functools import partial, wraps
+from functools import lru_cache, partial, wraps
 
 import gravity.io
 from gravity.config_manager import ConfigManager
@@ -26,6 +26,29 @@ def process_manager(*args, **kwargs):
         pm.terminate()
 
 
+@lru_cache(maxsize=None)
+def _routed_params(pm_class, func_name):
+    """Return the parameter names of a process manager method, which do not change once the class is defined."""
+    return frozenset(inspect.signature(getattr(pm_class, func_name)).parameters)
+
+
+# service command styles where the process manager runs the service's command directly
+DIRECT_SERVICE_COMMAND_STYLES = frozenset((ServiceCommandStyle.direct, ServiceCommandStyle.exec))
+
+
+@lru_cache(maxsize=None)
+def _galaxyctl_command():
+    """Return the shell-quoted galaxyctl command, warning (once) if it cannot be determined."""
+    # is there a click way to do this?
+    galaxyctl = sys.argv[0]
+    if galaxyctl.endswith(f"{os.path.sep}galaxy"):
+        # handle when called using the `galaxy` entrypoint
+        galaxyctl += "ctl"
+    if not galaxyctl.endswith(f"{os.path.sep}galaxyctl"):
+        gravity.io.warn(f"Unable to determine galaxyctl command, sys.argv[0] is: {galaxyctl}")
+    return shlex.quote(galaxyctl)
+
+
 def _route(func, all_process_managers=False):
     """Given instance names, populates kwargs with instance configs for the given PM, and calls the PM-routed function
     """
@@ -38,15 +61,13 @@ def _route(func, all_process_managers=False):
         if not configs:
             gravity.io.exception("No configured Galaxy instances")
         for config in configs:
-            try:
-                configs_by_pm[config.process_manager].append(config)
-            except KeyError:
-                configs_by_pm[config.process_manager] = [config]
+            configs_by_pm.setdefault(config.process_manager, []).append(config)
         if not all_process_managers:
             pm_names = configs_by_pm.keys()
         for pm_name in pm_names:
-            routed_func = getattr(self.process_managers[pm_name], func.__name__)
-            routed_func_params = list(inspect.signature(routed_func).parameters)
+            pm = self.process_managers[pm_name]
+            routed_func = getattr(pm, func.__name__)
+            routed_func_params = _routed_params(type(pm), func.__name__)
             if "configs" in routed_func_params:
                 pm_configs = configs_by_pm.get(pm_name, [])
                 kwargs["configs"] = pm_configs
@@ -67,7 +88,13 @@ route_to_all = partial(_route, all_process_managers=True)
 class BaseProcessExecutionEnvironment(metaclass=ABCMeta):
     def __init__(self, state_dir=None, config_file=None, config_manager=None, user_mode=None):
         self.config_manager = config_manager or ConfigManager(state_dir=state_dir, config_file=config_file, user_mode=user_mode)
-        self.tail = which("tail")
+        self.__config_format_vars = {}
+        self.__service_format_vars = {}
+
+    @property
+    def tail(self):
+        # only needed to follow logs, so don't search $PATH for it when setting up
+        return which("tail")
 
     @abstractmethod
     def _service_environment_formatter(self, environment, format_vars):
@@ -79,19 +106,33 @@ class BaseProcessExecutionEnvironment(metaclass=ABCMeta):
     def _service_program_name(self, instance_name, service):
         return f"{instance_name}_{service.service_type}_{service.service_name}"
 
+    def _config_format_vars(self, config):
+        """Return the format vars that are the same for every service in a config, computed once per config."""
+        if config not in self.__config_format_vars:
+            virtualenv_dir = config.virtualenv
+            self.__config_format_vars[config] = {
+                "galaxy_conf": config.galaxy_config_file,
+                "galaxy_root": config.galaxy_root,
+                "virtualenv_bin": shlex.quote(f'{os.path.join(virtualenv_dir, "bin")}{os.path.sep}') if virtualenv_dir else "",
+                "gravity_data_dir": shlex.quote(config.gravity_data_dir),
+                "app_config": config.app_config,
+            }
+        return self.__config_format_vars[config]
+
     def _service_format_vars(self, config, service, pm_format_vars=None):
+        # commands like `start` update more than once, only render each service once per set of inputs
         pm_format_vars = pm_format_vars or {}
-        virtualenv_dir = config.virtualenv
-        virtualenv_bin = shlex.quote(f'{os.path.join(virtualenv_dir, "bin")}{os.path.sep}') if virtualenv_dir else ""
+        key = (config, service.service_type, service.service_name, config.service_command_style,
+               tuple(sorted(pm_format_vars.items())))
+        if key not in self.__service_format_vars:
+            self.__service_format_vars[key] = self.__render_service_format_vars(config, service, pm_format_vars)
+        return self.__service_format_vars[key].copy()
 
+    def __render_service_format_vars(self, config, service, pm_format_vars):
         format_vars = {
+            **self._config_format_vars(config),
             "server_name": service.service_name,
             "galaxy_umask": service.settings.get("umask") or config.umask,
-            "galaxy_conf": config.galaxy_config_file,
-            "galaxy_root": config.galaxy_root,
-            "virtualenv_bin": virtualenv_bin,
-            "gravity_data_dir": shlex.quote(config.gravity_data_dir),
-            "app_config": config.app_config,
         }
 
         format_vars["settings"] = service.settings
@@ -101,45 +142,54 @@ class BaseProcessExecutionEnvironment(metaclass=ABCMeta):
         format_vars.update(pm_format_vars)
 
         # template the command template
-        if config.service_command_style in (ServiceCommandStyle.direct, ServiceCommandStyle.exec):
-            format_vars["command_arguments"] = service.get_command_arguments(format_vars)
-            format_vars["command"] = service.command_template.format(**format_vars)
-
-            # template env vars
-            environment = service.environment
-            virtualenv_bin = format_vars["virtualenv_bin"]  # could have been changed by pm_format_vars
-            if virtualenv_bin and service.add_virtualenv_to_path:
-                path = environment.get("PATH", self._service_default_path())
-                environment["PATH"] = ":".join([virtualenv_bin, path])
+        if config.service_command_style in DIRECT_SERVICE_COMMAND_STYLES:
+            environment = self.__direct_command(service, format_vars)
         else:
-            config_file = shlex.quote(config.gravity_config_file)
-            # is there a click way to do this?
-            galaxyctl = sys.argv[0]
-            if galaxyctl.endswith(f"{os.path.sep}galaxy"):
-                # handle when called using the `galaxy` entrypoint
-                galaxyctl += "ctl"
-            if not galaxyctl.endswith(f"{os.path.sep}galaxyctl"):
-                gravity.io.warn(f"Unable to determine galaxyctl command, sys.argv[0] is: {galaxyctl}")
-            galaxyctl = shlex.quote(galaxyctl)
-            instance_number_opt = ""
-            if service.count > 1:
-                instance_number_opt = f" --service-instance {pm_format_vars['instance_number']}"
-            format_vars["command"] = f"{galaxyctl} --config-file {config_file} exec{instance_number_opt} {config.instance_name} {service.service_name}"
-            environment = {}
+            environment = self.__galaxyctl_command(config, service, format_vars)
         format_vars["environment"] = self._service_environment_formatter(environment, format_vars)
 
         return format_vars
 
+    def __direct_command(self, service, format_vars):
+        """Set the command that runs the service directly, and return its environment."""
+        format_vars["command_arguments"] = service.get_command_arguments(format_vars)
+        format_vars["command"] = service.command_template.format_map(format_vars)
+
+        # template env vars
+        environment = service.environment
+        virtualenv_bin = format_vars["virtualenv_bin"]  # could have been changed by pm_format_vars
+        if virtualenv_bin and service.add_virtualenv_to_path:
+            # only look up the default if needed, it can require a subprocess
+            path = environment["PATH"] if "PATH" in environment else self._service_default_path()
+            environment["PATH"] = ":".join([virtualenv_bin, path])
+        return environment
+
+    def __galaxyctl_command(self, config, service, format_vars):
+        """Set the command that runs the service via `galaxyctl exec`, which sets up the environment itself."""
+        config_file = shlex.quote(config.gravity_config_file)
+        galaxyctl = _galaxyctl_command()
+        instance_number_opt = ""
+        if service.count > 1:
+            instance_number_opt = f" --service-instance {format_vars['instance_number']}"
+        format_vars["command"] = f"{galaxyctl} --config-file {config_file} exec{instance_number_opt} {config.instance_name} {service.service_name}"
+        return {}
+
 
 class BaseProcessManager(BaseProcessExecutionEnvironment, metaclass=ABCMeta):
     def __init__(self, *args, foreground=False, **kwargs):
         super().__init__(*args, **kwargs)
         self._service_changes = None
+        self.__use_instance_name = (None, None)
 
     @property
     def _use_instance_name(self):
-        return ((not self.config_manager.single_instance)
-                or self.config_manager.get_config().instance_name != DEFAULT_INSTANCE_NAME)
+        # checked for every service, so only recompute it if more instances have been loaded since the last check
+        instance_count = self.config_manager.instance_count
+        if self.__use_instance_name[0] != instance_count:
+            use_instance_name = ((not self.config_manager.single_instance)
+                                 or self.config_manager.get_config().instance_name != DEFAULT_INSTANCE_NAME)
+            self.__use_instance_name = (instance_count, use_instance_name)
+        return self.__use_instance_name[1]
 
     def _remove_unintended_pm_files_for_configs(self, configs):
         unintended_pm_files = set()
@@ -160,16 +210,17 @@ class BaseProcessManager(BaseProcessExecutionEnvironment, metaclass=ABCMeta):
         self._disable_and_remove_pm_files(pm_files)
 
     def _pre_update(self, configs, force, clean):
-        all_configs = set(self.config_manager.get_configs())
         if not clean:
             # no --clean and either possibility of --force
-            # remove any pm files for configs known to this gravity but managed by other PMs
-            self._remove_all_pm_files_for_configs(all_configs - set(configs))
+            # remove any pm files for configs known to this gravity but managed by other PMs, of which there are none
+            # in the common case that every config is managed by this PM
+            if len(configs) != self.config_manager.instance_count:
+                self._remove_all_pm_files_for_configs(set(self.config_manager.get_configs()) - set(configs))
             # always remove any unintended pm files for known configs managed by this PM
             self._remove_unintended_pm_files_for_configs(configs)
         elif not force:
             # --clean but no --force, so remove everything we know about
-            self._remove_all_pm_files_for_configs(all_configs)
+            self._remove_all_pm_files_for_configs(self.config_manager.get_configs())
             pm_files = self._all_present_pm_files()
             if pm_files:
                 gravity.io.warn(f"Configs not managed by this Gravity remain after cleaning, use --force to remove: {', '.join(pm_files)}")
@@ -178,27 +229,29 @@ class BaseProcessManager(BaseProcessExecutionEnvironment, metaclass=ABCMeta):
             self._remove_all_pm_files()
 
     def _create_dir_for(self, path):
-        try:
-            os.makedirs(os.path.dirname(path))
-        except OSError as exc:
-            if exc.errno != errno.EEXIST:
-                raise
-
-    def _file_needs_update(self, path, contents):
-        """Update if contents differ"""
-        if os.path.exists(path):
-            # check first whether there are changes
-            with open(path) as fh:
-                existing_contents = fh.read()
-            return existing_contents != contents
-        return True
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def _file_needs_update(self, path, contents, size):
+        """Update if contents (bytes) differ from those of the existing file at ``path``, which is ``size`` bytes"""
+        # a size mismatch means there are changes without needing to read the file
+        if size != len(contents):
+            return True
+        with open(path, "rb") as fh:
+            return fh.read() != contents
 
     def _update_file(self, path, contents, name, file_type, force):
-        if force or self._file_needs_update(path, contents):
-            verb = "Updating" if os.path.exists(path) else "Adding"
+        # encode once for both comparison and writing
+        contents = contents.encode("utf-8")
+        # stat once, for both whether the file exists and its size
+        try:
+            size = os.stat(path).st_size
+        except FileNotFoundError:
+            size = None
+        if force or size is None or self._file_needs_update(path, contents, size):
+            verb = "Updating" if size is not None else "Adding"
             gravity.io.info(f"{verb} {file_type} {name}")
             self._create_dir_for(path)
-            with open(path, "w") as out:
+            with open(path, "wb") as out:
                 out.write(contents)
             self._service_changes = True
             return True
@@ -249,7 +302,7 @@ class BaseProcessManager(BaseProcessExecutionEnvironment, metaclass=ABCMeta):
 
 class ProcessExecutor(BaseProcessExecutionEnvironment):
     def _service_environment_formatter(self, environment, format_vars):
-        return {k: v.format(**format_vars) for k, v in environment.items()}
+        return {k: v.format_map(format_vars) for k, v in environment.items()}
 
     def exec(self, config, service, service_instance_number=None, no_exec=False):
         service_name = service.service_name
@@ -271,23 +324,51 @@ class ProcessExecutor(BaseProcessExecutionEnvironment):
         format_vars = self._service_format_vars(config, service_instance)
         print_env = ' '.join('{}={}'.format(k, shlex.quote(v)) for k, v in format_vars["environment"].items())
 
-        cmd = shlex.split(format_vars["command"])
-        env = {**dict(os.environ), **format_vars["environment"]}
+        command = format_vars["command"]
+        if "'" in command or '"' in command or "\\" in command:
+            cmd = shlex.split(command)
+        else:
+            # without quoting or escapes shlex.split() is equivalent to a plain whitespace split
+            cmd = command.split()
+        env = os.environ.copy()
+        env.update(format_vars["environment"])
         cwd = format_vars["galaxy_root"]
 
         # ensure the data dir exists
-        try:
-            os.makedirs(config.gravity_data_dir)
-        except OSError as exc:
-            if exc.errno != errno.EEXIST:
-                raise
+        os.makedirs(config.gravity_data_dir, exist_ok=True)
 
         gravity.io.info(f"Working directory: {cwd}")
         gravity.io.info(f"Executing: {print_env} {format_vars['command']}")
 
         if not no_exec:
             os.chdir(cwd)
-            os.execvpe(cmd[0], cmd, env)
+            # resolve the executable once here rather than having execvpe() attempt an exec for each $PATH entry
+            executable = shutil.which(cmd[0], path=env.get("PATH"))
+            if executable is None:
+                # let execvpe() raise the appropriate error
+                os.execvpe(cmd[0], cmd, env)
+            os.execve(executable, cmd, env)
+
+
+class LazyProcessManagers(collections.abc.Mapping):
+    """Map process manager names to process managers, only creating each process manager when it is first used."""
+
+    def __init__(self, pm_classes, *args, **kwargs):
+        self.__pm_classes = {pm_class.name: pm_class for pm_class in pm_classes}
+        self.__args = args
+        self.__kwargs = kwargs
+        self.__process_managers = {}
+
+    def __getitem__(self, name):
+        if name not in self.__process_managers:
+            self.__process_managers[name] = self.__pm_classes[name](*self.__args, **self.__kwargs)
+        return self.__process_managers[name]
+
+    def __iter__(self):
+        return iter(self.__pm_classes)
+
+    def __len__(self):
+        return len(self.__pm_classes)
 
 
 class ProcessManagerRouter:
@@ -295,28 +376,35 @@ class ProcessManagerRouter:
         self.config_manager = config_manager or ConfigManager(state_dir=state_dir, config_file=config_file, user_mode=user_mode)
         self._load_pm_modules(**kwargs)
         self._process_executor = ProcessExecutor(config_manager=self.config_manager)
+        self.__known_names = (None, None, None)
 
     def _load_pm_modules(self, *args, **kwargs):
-        self.process_managers = {}
-        for filename in os.listdir(os.path.dirname(__file__)):
-            if filename.endswith(".py") and not filename.startswith("_"):
-                mod = importlib.import_module("gravity.process_manager." + filename[: -len(".py")])
-                for name in dir(mod):
-                    obj = getattr(mod, name)
-                    if not name.startswith("_") and inspect.isclass(obj) and issubclass(obj, BaseProcessManager) and obj != BaseProcessManager:
-                        pm = obj(*args, config_manager=self.config_manager, **kwargs)
-                        self.process_managers[pm.name] = pm
+        # imported here since the process manager modules import this one
+        from gravity.process_manager._registry import PM_CLASSES
+        # most commands only operate on instances managed by one process manager, so don't set up the others
+        self.process_managers = LazyProcessManagers(PM_CLASSES, *args, config_manager=self.config_manager, **kwargs)
+
+    def _known_names(self):
+        """Return the configured instance names and known service names as frozensets."""
+        # commands route more than once (e.g. update then start), only rebuild these if more instances have been loaded
+        instance_count = self.config_manager.instance_count
+        if self.__known_names[0] != instance_count:
+            self.__known_names = (
+                instance_count,
+                frozenset(self.config_manager.get_configured_instance_names()),
+                frozenset(self.config_manager.get_configured_service_names() | VALID_SERVICE_NAMES),
+            )
+        return self.__known_names[1:]
 
     def _instance_service_names(self, names):
         instance_names = []
         service_names = []
-        configured_instance_names = self.config_manager.get_configured_instance_names()
-        configured_service_names = self.config_manager.get_configured_service_names()
+        configured_instance_names, known_service_names = self._known_names()
         if names:
             for name in names:
                 if name in configured_instance_names:
                     instance_names.append(name)
-                elif name in configured_service_names | VALID_SERVICE_NAMES:
+                elif name in known_service_names:
                     service_names.append(name)
                 else:
                     gravity.io.warn(f"Warning: Not a known instance or service name: {name}")
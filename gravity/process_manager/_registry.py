@@ -0,0 +1,8 @@
+""" Process manager implementations known to Gravity.
+
+Kept separate from :mod:`gravity.process_manager` because the implementations import their base class from there.
+"""
+from gravity.process_manager.supervisor import SupervisorProcessManager
+from gravity.process_manager.systemd import SystemdProcessManager
+
+PM_CLASSES = (SupervisorProcessManager, SystemdProcessManager)
@@ -3,19 +3,22 @@
 import os
 import shlex
 import subprocess
+import sys
 import time
 from functools import partial
-from glob import glob
 
 import gravity.io
 from gravity.process_manager import BaseProcessManager
 from gravity.settings import ProcessManager
 from gravity.state import GracefulMethod
-from gravity.util import which
+from gravity.util import cached_by_stat, which
 
 from supervisor import supervisorctl  # type: ignore
 
 SUPERVISORD_START_TIMEOUT = 60
+# supervisord is usually up (or down) well within the first poll, so start polling quickly and back off from there
+SUPERVISORD_POLL_INTERVAL_MIN = 0.05
+SUPERVISORD_POLL_INTERVAL_MAX = 0.5
 DEFAULT_SUPERVISOR_SOCKET_PATH = os.environ.get("SUPERVISORD_SOCKET", '%(here)s/supervisor.sock')
 
 SUPERVISORD_CONF_TEMPLATE = f""";
@@ -71,13 +74,25 @@ SUPERVISORD_GROUP_TEMPLATE = """;
 programs = {programs}
 """
 
-DEFAULT_STATE_DIR = os.path.expanduser(os.path.join("~", ".config", "galaxy-gravity"))
 if "XDG_CONFIG_HOME" in os.environ:
     DEFAULT_STATE_DIR = os.path.join(os.environ["XDG_CONFIG_HOME"], "galaxy-gravity")
+else:
+    DEFAULT_STATE_DIR = os.path.expanduser(os.path.join("~", ".config", "galaxy-gravity"))
 
 
 class SupervisorProgram:
     # converts between different formats
+    __slots__ = (
+        "config",
+        "service",
+        "_use_instance_name",
+        "config_process_name",
+        "config_numprocs",
+        "config_numprocs_start",
+        "config_instance_program_name",
+        "log_file_name_template",
+    )
+
     def __init__(self, config, service, use_instance_name):
         self.config = config
         self.service = service
@@ -159,6 +174,8 @@ class SupervisorProcessManager(BaseProcessManager):
         self.supervisord_pid_path = os.path.join(self.supervisor_state_dir, "supervisord.pid")
         self.supervisord_sock_path = os.environ.get("SUPERVISORD_SOCKET", os.path.join(self.supervisor_state_dir, "supervisor.sock"))
         self.__supervisord_popen = None
+        self.__controller = None
+        self.__programs = {}
         self.foreground = foreground
 
     @property
@@ -166,49 +183,61 @@ class SupervisorProcessManager(BaseProcessManager):
         return os.path.join(self.supervisor_state_dir, "supervisord.log")
 
     def __supervisord_is_running(self):
+        # not running is the common case, check for it without raising
+        if not os.path.exists(self.supervisord_sock_path):
+            return False
         try:
-            assert os.path.exists(self.supervisord_pid_path)
-            assert os.path.exists(self.supervisord_sock_path)
-            os.kill(int(open(self.supervisord_pid_path).read()), 0)
+            # the running check happens several times per command, only reread the pidfile if it has been rewritten
+            os.kill(cached_by_stat(self.supervisord_pid_path, _read_pid), 0)
             return True
-        except Exception:
+        except (OSError, ValueError):
             return False
 
     def __supervisord(self):
-        format_vars = {"supervisor_state_dir": self.supervisor_state_dir, "supervisord_conf_dir": self.supervisord_conf_dir}
         supervisord_cmd = [self.supervisord_exe, "-c", self.supervisord_conf_path]
         if self.foreground:
             supervisord_cmd.append('--nodaemon')
         if not self.__supervisord_is_running():
             # any time that supervisord is not running, let's rewrite supervisord.conf
-            if not os.path.exists(self.supervisord_conf_dir):
-                os.makedirs(self.supervisord_conf_dir)
-            open(self.supervisord_conf_path, "w").write(SUPERVISORD_CONF_TEMPLATE.format(**format_vars))
+            os.makedirs(self.supervisord_conf_dir, exist_ok=True)
+            with open(self.supervisord_conf_path, "w") as out:
+                # the template is already fully rendered, supervisord expands the %(here)s references itself
+                out.write(SUPERVISORD_CONF_TEMPLATE)
             self.__supervisord_popen = subprocess.Popen(supervisord_cmd, env=os.environ)
             rc = self.__supervisord_popen.poll()
             if rc:
                 gravity.io.error("supervisord exited with code %d" % rc)
             start = time.time()
+            interval = SUPERVISORD_POLL_INTERVAL_MIN
             while not os.path.exists(self.supervisord_pid_path) or not os.path.exists(self.supervisord_sock_path):
                 if (time.time() - start) > SUPERVISORD_START_TIMEOUT:
                     gravity.io.exception("Timed out waiting for supervisord to start")
                 gravity.io.debug(f"Waiting for {self.supervisord_pid_path}")
-                time.sleep(0.5)
+                time.sleep(interval)
+                interval = min(interval * 2, SUPERVISORD_POLL_INTERVAL_MAX)
+
+    def __get_controller(self):
+        """Return the supervisorctl controller, parsing supervisord.conf only on first use"""
+        if self.__controller is None:
+            options = supervisorctl.ClientOptions()
+            options.realize(args=["-c", self.supervisord_conf_path])
+            # realize() without a command means an interactive session, which would e.g. prompt before shutdown
+            options.interactive = 0
+            self.__controller = supervisorctl.Controller(options)
+        return self.__controller
 
     def __get_supervisor(self):
         """Return the supervisor proxy object
 
         Should probably use this more rather than supervisorctl directly
         """
-        options = supervisorctl.ClientOptions()
-        options.realize(args=["-c", self.supervisord_conf_path])
-        return supervisorctl.Controller(options).get_supervisor()
+        return self.__get_controller().get_supervisor()
 
     def _service_default_path(self):
         return "%(ENV_PATH)s"
 
     def _service_environment_formatter(self, environment, format_vars):
-        return ",".join("{}={}".format(k, shlex.quote(v.format(**format_vars))) for k, v in environment.items())
+        return ",".join("{}={}".format(k, shlex.quote(v.format_map(format_vars))) for k, v in environment.items())
 
     def terminate(self):
         if self.foreground:
@@ -233,7 +262,7 @@ class SupervisorProcessManager(BaseProcessManager):
         group_file = os.path.join(self.supervisord_conf_dir, f"group_{instance_name}.conf")
         if os.path.exists(group_file):
             pm_files.add(group_file)
-        pm_files.update(glob(os.path.join(instance_conf_dir, "*")))
+        pm_files.update(_dir_entry_paths(instance_conf_dir))
         return pm_files
 
     def _intended_pm_files_for_config(self, config):
@@ -241,18 +270,30 @@ class SupervisorProcessManager(BaseProcessManager):
         instance_name = config.instance_name
         instance_conf_dir = os.path.join(self.supervisord_conf_dir, f"{instance_name}.d")
         for service in config.services:
-            program = SupervisorProgram(config, service, self._use_instance_name)
+            program = self.__supervisor_program(config, service)
             pm_files.add(os.path.join(instance_conf_dir, program.config_file_name))
         if self._use_instance_name:
             pm_files.add(os.path.join(self.supervisord_conf_dir, f"group_{instance_name}.conf"))
         return pm_files
 
     def _all_present_pm_files(self):
-        return (glob(os.path.join(self.supervisord_conf_dir, "*.d", "*")) +
-                glob(os.path.join(self.supervisord_conf_dir, "group_*.conf")))
+        # equivalent to globbing for supervisord.conf.d/*.d/* and supervisord.conf.d/group_*.conf, in one directory pass
+        instance_files = []
+        group_files = []
+        try:
+            with os.scandir(self.supervisord_conf_dir) as it:
+                entries = [e for e in it if not e.name.startswith(".")]
+        except OSError:
+            return []
+        for entry in entries:
+            if entry.name.endswith(".d") and entry.is_dir():
+                instance_files.extend(_dir_entry_paths(entry.path))
+            elif entry.name.startswith("group_") and entry.name.endswith(".conf"):
+                group_files.append(entry.path)
+        return instance_files + group_files
 
     def __update_service(self, config, service, instance_conf_dir, instance_name, force):
-        program = SupervisorProgram(config, service, self._use_instance_name)
+        program = self.__supervisor_program(config, service)
         # supervisor-specific format vars
         supervisor_format_vars = {
             "log_dir": config.log_dir,
@@ -267,43 +308,52 @@ class SupervisorProcessManager(BaseProcessManager):
 
         conf = os.path.join(instance_conf_dir, program.config_file_name)
         template = SUPERVISORD_SERVICE_TEMPLATE
-        contents = template.format(**format_vars)
+        contents = template.format_map(format_vars)
         name = service.service_name if not self._use_instance_name else f"{instance_name}:{service.service_name}"
-        if self._update_file(conf, contents, name, "service", force):
-            self.supervisorctl('reread')
-        return conf
+        return self._update_file(conf, contents, name, "service", force)
 
     def __process_config(self, config, force):
         """Perform necessary supervisor config updates as per current Galaxy/Gravity configuration.
 
-        Does not call ``supervisorctl update``.
+        Does not call ``supervisorctl update`` or ``supervisorctl reread``, returns whether any config files changed.
         """
         instance_name = config.instance_name
         instance_conf_dir = os.path.join(self.supervisord_conf_dir, f"{instance_name}.d")
 
+        changed = False
         programs = []
         for service in config.services:
-            self.__update_service(config, service, instance_conf_dir, instance_name, force)
+            changed |= self.__update_service(config, service, instance_conf_dir, instance_name, force)
             programs.append(f"{instance_name}_{service.service_type}_{service.service_name}")
 
         group_conf = os.path.join(self.supervisord_conf_dir, f"group_{instance_name}.conf")
         if self._use_instance_name:
             format_vars = {"instance_name": instance_name, "programs": ",".join(programs)}
             contents = SUPERVISORD_GROUP_TEMPLATE.format(**format_vars)
-            if self._update_file(group_conf, contents, instance_name, "supervisor group", force):
-                self.supervisorctl('reread')
+            changed |= self._update_file(group_conf, contents, instance_name, "supervisor group", force)
         elif os.path.exists(group_conf):
             os.unlink(group_conf)
+        return changed
 
     def __process_configs(self, configs, force):
+        changed = False
         for config in configs:
-            self.__process_config(config, force)
-            if not os.path.exists(config.log_dir):
-                os.makedirs(config.log_dir)
+            changed |= self.__process_config(config, force)
+            os.makedirs(config.log_dir, exist_ok=True)
+        # reread once for all changed files rather than once per changed file
+        if changed and self.__supervisord_is_running():
+            self.supervisorctl("reread")
+
+    def __supervisor_program(self, config, service):
+        use_instance_name = self._use_instance_name
+        key = (config, service.service_type, service.service_name, use_instance_name)
+        if key not in self.__programs:
+            self.__programs[key] = SupervisorProgram(config, service, use_instance_name)
+        return self.__programs[key]
 
     def __supervisor_programs(self, config, service_names):
         services = config.get_services(service_names)
-        return [SupervisorProgram(config, service, self._use_instance_name) for service in services]
+        return [self.__supervisor_program(config, service) for service in services]
 
     def __supervisor_program_names(self, config, service_names):
         program_names = []
@@ -323,17 +373,27 @@ class SupervisorProcessManager(BaseProcessManager):
         self.supervisorctl(op, *targets)
 
     def __reload_graceful(self, configs, service_names):
+        # signal and restart everything that can be in one supervisorctl call each, rolling restarts go one at a time
+        sighup_names = []
+        restart_names = []
+        rolling = []
         for config in configs:
             services = config.get_services(service_names)
             for service in services:
-                program = self.__supervisor_programs(config, [service.service_name])[0]
+                program = self.__supervisor_program(config, service)
                 graceful_method = service.graceful_method
                 if graceful_method == GracefulMethod.SIGHUP:
-                    self.supervisorctl("signal", "SIGHUP", *program.program_names)
+                    sighup_names.extend(program.program_names)
                 elif graceful_method == GracefulMethod.ROLLING:
-                    self.__rolling_restart(config, service, program)
+                    rolling.append((config, service, program))
                 elif graceful_method != GracefulMethod.NONE:
-                    self.supervisorctl("restart", *program.program_names)
+                    restart_names.extend(program.program_names)
+        if sighup_names:
+            self.supervisorctl("signal", "SIGHUP", *sighup_names)
+        if restart_names:
+            self.supervisorctl("restart", *restart_names)
+        for config, service, program in rolling:
+            self.__rolling_restart(config, service, program)
 
     def __rolling_restart(self, config, service, program):
         restart_callbacks = list(partial(self.supervisorctl, "restart", p) for p in program.program_names)
@@ -346,18 +406,17 @@ class SupervisorProcessManager(BaseProcessManager):
             gravity.io.exception("`tail` not found on $PATH, please install it")
         log_files = []
         if quiet:
-            cmd = [self.tail, "-f", self.log_file]
-            tail_popen = subprocess.Popen(cmd)
-            tail_popen.wait()
+            log_files.append(self.log_file)
         else:
             for config in configs:
                 log_dir = config.log_dir
                 programs = self.__supervisor_programs(config, service_names)
                 for program in programs:
                     log_files.extend(os.path.join(log_dir, f) for f in program.log_file_names)
-            cmd = [self.tail, "-f"] + log_files
-            tail_popen = subprocess.Popen(cmd)
-            tail_popen.wait()
+        # follow everything with a single tail, instances can share a log dir so don't pass the same file twice
+        cmd = [self.tail, "-f"] + list(dict.fromkeys(log_files))
+        tail_popen = subprocess.Popen(cmd)
+        tail_popen.wait()
 
     def start(self, configs=None, service_names=None):
         self.update(configs=configs)
@@ -401,9 +460,11 @@ class SupervisorProcessManager(BaseProcessManager):
 
     def shutdown(self):
         self.supervisorctl("shutdown")
+        interval = SUPERVISORD_POLL_INTERVAL_MIN
         while self.__supervisord_is_running():
             gravity.io.debug("Waiting for supervisord to terminate")
-            time.sleep(0.5)
+            time.sleep(interval)
+            interval = min(interval * 2, SUPERVISORD_POLL_INTERVAL_MAX)
         gravity.io.info("supervisord has terminated")
 
     def update(self, configs=None, force=False, clean=False):
@@ -419,9 +480,20 @@ class SupervisorProcessManager(BaseProcessManager):
         if not self.__supervisord_is_running():
             gravity.io.warn("supervisord is not running")
             return
+        gravity.io.debug("Calling supervisorctl with args: %s", list(args))
+        if args:
+            # same as supervisorctl.main() minus reparsing the config for every command
+            controller = self.__get_controller()
+            # the controller is reused, so follow any redirection of stdout since it was created
+            controller.stdout = sys.stdout
+            controller.exitstatus = supervisorctl.LSBInitExitStatuses.SUCCESS
+            controller.onecmd(" ".join(args))
+            if controller.exitstatus != supervisorctl.LSBInitExitStatuses.SUCCESS:
+                raise SystemExit(controller.exitstatus)
+            return
         try:
-            gravity.io.debug("Calling supervisorctl with args: %s", list(args))
-            supervisorctl.main(args=["-c", self.supervisord_conf_path] + list(args))
+            # no args is an interactive session, leave that to supervisorctl
+            supervisorctl.main(args=["-c", self.supervisord_conf_path])
         except SystemExit as e:
             # supervisorctl.main calls sys.exit(), so we catch that
             if e.code == 0:
@@ -432,6 +504,21 @@ class SupervisorProcessManager(BaseProcessManager):
     pm = supervisorctl
 
 
+def _read_pid(pid_path):
+    with open(pid_path) as fh:
+        return int(fh.read())
+
+
+def _dir_entry_paths(path):
+    """Return the paths of the non-hidden entries in ``path``, like ``glob(os.path.join(path, "*"))`` but with a single
+    ``os.scandir()`` pass."""
+    try:
+        with os.scandir(path) as it:
+            return [e.path for e in it if not e.name.startswith(".")]
+    except OSError:
+        return []
+
+
 def supervisor_program_names(service_name, instance_count, instance_number_start, instance_name=None):
     # this is what supervisor turns the service name into depending on groups and numprocs
     if instance_count > 1 and instance_name is not None:
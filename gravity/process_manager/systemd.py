@@ -12,7 +12,7 @@ from gravity.process_manager import BaseProcessManager
 from gravity.settings import ProcessManager
 from gravity.state import GracefulMethod
 
-SYSTEMD_TARGET_HASH_RE = r";\s*GRAVITY=([0-9a-f]+)"
+SYSTEMD_TARGET_HASH_RE = re.compile(r";\s*GRAVITY=([0-9a-f]+)")
 
 SYSTEMD_SERVICE_TEMPLATE = """;
 ; This file is maintained by Gravity - CHANGES WILL BE OVERWRITTEN
@@ -65,6 +65,8 @@ WantedBy=multi-user.target
 
 class SystemdService:
     # converts between different formats
+    __slots__ = ("config", "service", "_use_instance_name", "unit_prefix", "description")
+
     def __init__(self, config, service, use_instance_name):
         self.config = config
         self.service = service
@@ -113,13 +115,12 @@ class SystemdProcessManager(BaseProcessManager):
         self.user_mode = self.config_manager.user_mode
         if self.user_mode is None:
             self.user_mode = not self.config_manager.is_root
-
-    @property
-    def __systemd_unit_dir(self):
-        unit_path = os.environ.get("GRAVITY_SYSTEMD_UNIT_PATH")
-        if not unit_path:
-            unit_path = "/etc/systemd/system" if not self.user_mode else os.path.expanduser("~/.config/systemd/user")
-        return unit_path
+        self.__default_path = None
+        # used for every unit file path, so resolve it once up front
+        self.__systemd_unit_dir = os.environ.get("GRAVITY_SYSTEMD_UNIT_PATH")
+        if not self.__systemd_unit_dir:
+            self.__systemd_unit_dir = (
+                "/etc/systemd/system" if not self.user_mode else os.path.expanduser("~/.config/systemd/user"))
 
     def __systemctl(self, *args, ignore_rc=None, not_found_rc=None, capture=False, **kwargs):
         args = list(args)
@@ -149,13 +150,17 @@ class SystemdProcessManager(BaseProcessManager):
         subprocess.check_call(["journalctl"] + args)
 
     def _service_default_path(self):
-        environ = self.__systemctl("show-environment", capture=True)
-        for line in environ.splitlines():
-            if line.startswith("PATH="):
-                return line.split("=", 1)[1]
+        # this is needed for every service that adds the virtualenv to $PATH, only spawn systemctl once
+        if self.__default_path is None:
+            environ = self.__systemctl("show-environment", capture=True)
+            for line in environ.splitlines():
+                if line.startswith("PATH="):
+                    self.__default_path = line.split("=", 1)[1]
+                    break
+        return self.__default_path
 
     def _service_environment_formatter(self, environment, format_vars):
-        return "\n".join("Environment={}={}".format(k, shlex.quote(v.format(**format_vars))) for k, v in environment.items())
+        return "\n".join("Environment={}={}".format(k, shlex.quote(v.format_map(format_vars))) for k, v in environment.items())
 
     def terminate(self):
         # this is used to stop a foreground supervisord in the supervisor PM, so it is a no-op here
@@ -200,7 +205,7 @@ class SystemdProcessManager(BaseProcessManager):
         # file, so that it can determine whether or not it "owns" a given set of unit files, and only clean those.
         with open(target_path) as fh:
             for line in fh:
-                match = re.match(SYSTEMD_TARGET_HASH_RE, line)
+                match = SYSTEMD_TARGET_HASH_RE.match(line)
                 if match:
                     return match.group(1)
 
@@ -208,11 +213,13 @@ class SystemdProcessManager(BaseProcessManager):
         unit_files = set()
         instance_name = f"-{config.instance_name}" if self._use_instance_name else ""
         target = os.path.join(self.__systemd_unit_dir, f"galaxy{instance_name}.target")
-        if os.path.exists(target):
+        try:
             target_hash = self.__read_gravity_config_hash_from_target(target)
-            if target_hash == config.path_hash:
-                unit_files.add(target)
-                unit_files.update(glob(f"{os.path.splitext(target)[0]}-*.service"))
+        except FileNotFoundError:
+            return unit_files
+        if target_hash == config.path_hash:
+            unit_files.add(target)
+            unit_files.update(glob(f"{os.path.splitext(target)[0]}-*.service"))
         return unit_files
 
     def _intended_pm_files_for_config(self, config):
@@ -229,7 +236,7 @@ class SystemdProcessManager(BaseProcessManager):
                 glob(os.path.join(self.__systemd_unit_dir, "galaxy-*.target")) +
                 glob(os.path.join(self.__systemd_unit_dir, "galaxy.target")))
 
-    def __update_service(self, config, service, systemd_service: SystemdService, force: bool):
+    def __virtualenv_bin(self, config):
         # under supervisor we expect that gravity is installed in the galaxy venv and the venv is active when gravity
         # runs, but under systemd this is not the case. we do assume $VIRTUAL_ENV is the galaxy venv if running as an
         # unprivileged user, though.
@@ -241,7 +248,9 @@ class SystemdProcessManager(BaseProcessManager):
             virtualenv_dir = environ_virtual_env
         elif not virtualenv_dir:
             gravity.io.exception("The `virtualenv` Gravity config option must be set when using the systemd process manager")
+        return shlex.quote(f'{os.path.join(virtualenv_dir, "bin")}{os.path.sep}')
 
+    def __update_service(self, config, service, systemd_service: SystemdService, virtualenv_bin: str, force: bool):
         memory_limit = service.settings.get("memory_limit") or config.memory_limit
         if memory_limit:
             memory_limit = f"MemoryLimit={memory_limit}G"
@@ -252,7 +261,7 @@ class SystemdProcessManager(BaseProcessManager):
 
         # systemd-specific format vars
         systemd_format_vars = {
-            "virtualenv_bin": shlex.quote(f'{os.path.join(virtualenv_dir, "bin")}{os.path.sep}'),
+            "virtualenv_bin": virtualenv_bin,
             "instance_number": "%i",
             "systemd_user_group": "",
             "systemd_exec_reload": exec_reload or "",
@@ -270,14 +279,17 @@ class SystemdProcessManager(BaseProcessManager):
         unit_file = systemd_service.unit_file_name
         conf = os.path.join(self.__systemd_unit_dir, unit_file)
         template = SYSTEMD_SERVICE_TEMPLATE
-        contents = template.format(**format_vars)
+        contents = template.format_map(format_vars)
         self._update_file(conf, contents, unit_file, "systemd unit", force)
 
     def __process_config(self, config, force):
+        """Write the unit files for a config, returning the path of its target unit if it changed."""
         service_units = []
+        # the same for every service, so only resolve (and warn about) it once per config
+        virtualenv_bin = self.__virtualenv_bin(config) if config.services else None
         for service in config.services:
             systemd_service = SystemdService(config, service, self._use_instance_name)
-            self.__update_service(config, service, systemd_service, force)
+            self.__update_service(config, service, systemd_service, virtualenv_bin, force)
             service_units.extend(systemd_service.unit_names)
 
         # create systemd target
@@ -292,11 +304,18 @@ class SystemdProcessManager(BaseProcessManager):
             format_vars["systemd_description"] += f" {config.instance_name}"
         contents = SYSTEMD_TARGET_TEMPLATE.format(**format_vars)
         if self._update_file(target_conf, contents, target_unit_name, "systemd unit", force):
-            self.__systemctl("enable", target_conf)
+            return target_conf
+        return None
 
     def __process_configs(self, configs, force):
+        changed_targets = []
         for config in configs:
-            self.__process_config(config, force)
+            target_conf = self.__process_config(config, force)
+            if target_conf:
+                changed_targets.append(target_conf)
+        # enable all changed targets with a single systemctl call
+        if changed_targets:
+            self.__systemctl("enable", *changed_targets)
 
     def __unit_names(self, configs, service_names, use_target=True, include_services=False):
         unit_names = []
@@ -4,6 +4,7 @@ state data.
 from __future__ import annotations
 
 import enum
+import functools
 import hashlib
 import os
 import sys
@@ -17,7 +18,7 @@ except ImportError:
 
 import gravity.io
 from gravity.settings import AppServer, ProcessManager, ServiceCommandStyle
-from gravity.util import http_check
+from gravity.util import cached_by_stat, http_check
 
 DEFAULT_GALAXY_ENVIRONMENT = {
     "PYTHONPATH": "lib",
@@ -26,6 +27,29 @@ DEFAULT_GALAXY_ENVIRONMENT = {
 CELERY_BEAT_DB_FILENAME = "celery-beat-schedule"
 
 
+@functools.lru_cache(maxsize=None)
+def path_hash(path):
+    return hashlib.sha1(path.encode("UTF-8")).hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def galaxy_root_for_config_file(galaxy_config_file):
+    """Locate Galaxy's root directory relative to its config file, or return None if it can't be found."""
+    config_dir = os.path.dirname(galaxy_config_file)
+    if os.path.exists(os.path.join(config_dir, os.pardir, "lib", "galaxy")):
+        return os.path.abspath(os.path.join(config_dir, os.pardir))
+    elif galaxy_config_file.endswith(os.path.join("galaxy", "config", "sample", "galaxy.yml.sample")):
+        return os.path.abspath(os.path.join(config_dir, os.pardir, os.pardir, os.pardir, os.pardir))
+    return None
+
+
+def _read_galaxy_version(galaxy_version_file):
+    with open(galaxy_version_file) as fh:
+        locs = {}
+        exec(fh.read(), {}, locs)
+    return locs["VERSION"]
+
+
 def relative_to_galaxy_root(cls, v, values):
     if not os.path.isabs(v):
         v = os.path.abspath(os.path.join(values["galaxy_root"], v))
@@ -62,27 +86,23 @@ class ConfigFile(BaseModel):
 
     @property
     def path_hash(self):
-        return hashlib.sha1(self.gravity_config_file.encode("UTF-8")).hexdigest()
+        # computed once per path, this is compared against every systemd target on each update
+        return path_hash(self.gravity_config_file)
 
     @property
     def galaxy_version(self):
         galaxy_version_file = os.path.join(self.galaxy_root, "lib", "galaxy", "version.py")
-        with open(galaxy_version_file) as fh:
-            locs = {}
-            exec(fh.read(), {}, locs)
-            return locs["VERSION"]
+        # this is checked repeatedly while waiting on rolling restarts, only re-exec version.py if it has changed
+        return cached_by_stat(galaxy_version_file, _read_galaxy_version)
 
     @validator("galaxy_root")
     def _galaxy_root_required(cls, v, values):
         if v is None:
-            galaxy_config_file = values["galaxy_config_file"]
             if os.environ.get("GALAXY_ROOT_DIR"):
                 v = os.path.abspath(os.environ["GALAXY_ROOT_DIR"])
-            elif os.path.exists(os.path.join(os.path.dirname(galaxy_config_file), os.pardir, "lib", "galaxy")):
-                v = os.path.abspath(os.path.join(os.path.dirname(galaxy_config_file), os.pardir))
-            elif galaxy_config_file.endswith(os.path.join("galaxy", "config", "sample", "galaxy.yml.sample")):
-                v = os.path.abspath(os.path.join(os.path.dirname(galaxy_config_file), os.pardir, os.pardir, os.pardir, os.pardir))
             else:
+                v = galaxy_root_for_config_file(values["galaxy_config_file"])
+            if v is None:
                 gravity.io.exception(
                     "Cannot locate Galaxy root directory: set $GALAXY_ROOT_DIR, the Gravity `galaxy_root` option, or "
                     "`root' in the Galaxy config")
@@ -96,6 +116,7 @@ class ConfigFile(BaseModel):
 
     def get_services(self, service_names):
         if service_names:
+            service_names = set(service_names)
             return [s for s in self.services if s.service_name in service_names]
         else:
             return self.services
@@ -198,7 +219,7 @@ class Service(BaseModel):
         for setting, value in self.settings.items():
             if setting in self.command_arguments:
                 if value:
-                    rval[setting] = self.command_arguments[setting].format(**format_vars)
+                    rval[setting] = self.command_arguments[setting].format_map(format_vars)
                 else:
                     rval[setting] = ""
             else:
@@ -2,16 +2,17 @@
 """
 import collections.abc
 import copy
+import functools
 import os
 import sys
 
-import jsonref
-import requests
-import requests_unixsocket
 import yaml
 
 from gravity.settings import Settings
 
+# (path, loader) -> ((st_mtime_ns, st_size), result), see cached_by_stat()
+_stat_cache = {}
+
 
 def recursive_update(to_update, update_from):
     """
@@ -29,16 +30,40 @@ def recursive_update(to_update, update_from):
 
 
 def which(file):
+    # each process manager and the executor look up the same executables, only walk $PATH once per file
+    return _which(file, os.environ["PATH"])
+
+
+@functools.lru_cache(maxsize=None)
+def _which(file, search_path):
     # http://stackoverflow.com/questions/5226958/which-equivalent-function-in-python
     if os.path.exists(os.path.dirname(sys.executable) + "/" + file):
         return os.path.dirname(sys.executable) + "/" + file
-    for path in os.environ["PATH"].split(":"):
+    for path in search_path.split(":"):
         if os.path.exists(path + "/" + file):
             return path + "/" + file
     return None
 
 
+def cached_by_stat(path, loader):
+    """Return ``loader(path)``, reusing the previous result as long as the file's mtime and size are unchanged.
+
+    ``loader`` should be a module-level function or static method, results are cached per ``(path, loader)``. Raises
+    ``OSError`` (e.g. ``FileNotFoundError``) if ``path`` cannot be stat'd.
+    """
+    st = os.stat(path)
+    stat_key = (st.st_mtime_ns, st.st_size)
+    cached = _stat_cache.get((path, loader))
+    if cached is None or cached[0] != stat_key:
+        cached = (stat_key, loader(path))
+        _stat_cache[(path, loader)] = cached
+    return cached[1]
+
+
 def settings_to_sample():
+    # only used to generate the sample config, don't make every CLI invocation pay for the import
+    import jsonref
+
     schema = Settings.schema_json()
     # expand schema for easier processing
     data = jsonref.loads(schema)
@@ -92,6 +117,10 @@ def process_property(key, value, depth=0):
 
 
 def http_check(bind, path):
+    # requests is slow to import and is only needed for rolling restart readiness checks
+    import requests
+    import requests_unixsocket
+
     if bind.startswith("unix:"):
         socket = requests.utils.quote(bind.split(":", 1)[1], safe="")
         session = requests_unixsocket.Session()
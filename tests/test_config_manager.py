@@ -1,6 +1,7 @@
 import json
 from pathlib import Path
 
+import click
 import pytest
 
 from gravity import config_manager
@@ -109,4 +110,28 @@ def test_gunicorn_graceful_method_no_preload(galaxy_yml, default_config_manager)
     assert graceful_method == GracefulMethod.SIGHUP
 
 
+def test_expand_handlers_does_not_modify_settings(galaxy_yml, default_config_manager):
+    default_config_manager.load_config_file(str(galaxy_yml))
+    config = default_config_manager.get_config()
+    handlers = {'handler': {'processes': 2, 'pools': ['job-handlers']}}
+    gravity_settings = Settings(handlers=handlers)
+    expanded_handlers = config_manager.ConfigManager.expand_handlers(gravity_settings, config)
+    assert [h['server_name'] for h in expanded_handlers['handler']] == ['handler_0', 'handler_1']
+    assert expanded_handlers['handler'][0]['server_pools'] == ['job-handlers']
+    assert gravity_settings.handlers == handlers
+
+
+def test_get_job_config_xml_dynamic_handlers(tmp_path):
+    job_conf = tmp_path / 'job_conf.xml'
+    job_conf.write_text('<job_conf><handlers assign_with="db-skip-locked, db-transaction-isolation"/></job_conf>')
+    assign_with, handlers = config_manager.ConfigManager.get_job_config(str(job_conf))
+    assert assign_with == ['db-skip-locked', 'db-transaction-isolation']
+    assert handlers == []
+
+
+def test_get_job_config_missing_unknown_type(tmp_path):
+    with pytest.raises(click.ClickException, match="Unknown job config file type"):
+        config_manager.ConfigManager.get_job_config(str(tmp_path / 'job_conf.ini'))
+
+
 # TODO: tests for switching process managers between supervisor and systemd
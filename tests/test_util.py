@@ -0,0 +1,19 @@
+from gravity.util import cached_by_stat
+
+
+def test_cached_by_stat_invalidated_on_change(tmp_path):
+    path = tmp_path / "file.txt"
+    path.write_text("one")
+    loads = []
+
+    def loader(p):
+        loads.append(p)
+        with open(p) as fh:
+            return fh.read()
+
+    assert cached_by_stat(str(path), loader) == "one"
+    assert cached_by_stat(str(path), loader) == "one"
+    assert len(loads) == 1
+    path.write_text("three")
+    assert cached_by_stat(str(path), loader) == "three"
+    assert len(loads) == 2